@@ -1,8 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file
 from model.transformer_model import ThreatDetectionModel
 from backend.utils.url_analyzer import URLAnalyzer
 from backend.utils.feature_extractor import FeatureExtractor
 from backend.utils.visualizations import get_model_metrics, generate_visualization_data
+from backend.utils.profiler import ScanProfiler
 
 scanner_bp = Blueprint('scanner', __name__)
 
@@ -10,6 +11,7 @@ scanner_bp = Blueprint('scanner', __name__)
 analyzer = URLAnalyzer()
 extractor = FeatureExtractor()
 model = ThreatDetectionModel()
+profiler = ScanProfiler.from_env()
 
 @scanner_bp.route('/scan', methods=['POST'])
 def scan_url():
@@ -24,14 +26,15 @@ def scan_url():
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
         
-        # Analyze URL
-        url_features = analyzer.analyze(url)
-        
-        # Extract features
-        features = extractor.extract(url, url_features)
-        
-        # Predict threat
-        prediction = model.predict(features)
+        with profiler.maybe_profile(request.headers, url):
+            # Analyze URL
+            url_features = analyzer.analyze(url)
+            
+            # Extract features
+            features = extractor.extract(url, url_features)
+            
+            # Predict threat
+            prediction = model.predict(features)
         
         response = {
             'url': url,
@@ -57,6 +60,40 @@ def get_metrics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@scanner_bp.route('/profiles', methods=['GET'])
+def list_profiles():
+    if not profiler.is_authorized(request.headers):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify({
+        'settings': profiler.settings(),
+        'profiles': profiler.list_profiles()
+    }), 200
+
+@scanner_bp.route('/profiles/config', methods=['POST'])
+def configure_profiler():
+    if not profiler.is_authorized(request.headers):
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        data = request.get_json() or {}
+        settings = profiler.configure(
+            sample_rate=data.get('sample_rate'),
+            max_profiles=data.get('max_profiles')
+        )
+        return jsonify(settings), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+
+@scanner_bp.route('/profiles/<profile_id>/<fmt>', methods=['GET'])
+def download_profile(profile_id, fmt):
+    if not profiler.is_authorized(request.headers):
+        return jsonify({'error': 'Unauthorized'}), 403
+    path = profiler.profile_path(profile_id, fmt)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, as_attachment=True)
+
 def get_recommendations(prediction):
     recommendations = []
     
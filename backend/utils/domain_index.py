@@ -0,0 +1,255 @@
+import argparse
+import csv
+import hashlib
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from itertools import chain
+from datetime import date
+
+import numpy as np
+
+# Common second-level public suffixes, so "example.co.uk" resolves to itself
+# rather than "co.uk". Not a full public suffix list.
+SECOND_LEVEL_SUFFIXES = {
+    'ac', 'co', 'com', 'edu', 'gov', 'net', 'org', 'ne', 'or', 'go', 'gob', 'mil'
+}
+
+MAGIC = b'DAIX'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ')  # magic, version, record count
+EPOCH = date(1970, 1, 1)
+
+_DATE_PATTERN = re.compile(r'(\d{4})-?(\d{2})-?(\d{2})')
+
+
+def registrable_domain(host):
+    """
+    Reduces a hostname to its registrable domain, e.g. "a.b.example.co.uk"
+    becomes "example.co.uk". Unicode labels are IDNA-encoded to match the
+    punycode form used in registration snapshots.
+    """
+    host = host.strip().lower().rstrip('.')
+    host = host.rsplit('@', 1)[-1].split(':', 1)[0]
+    labels = [_to_ascii(label) for label in host.split('.') if label]
+    if len(labels) <= 2:
+        return '.'.join(labels)
+    if len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_SUFFIXES:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+def _to_ascii(label):
+    """
+    Punycode-encodes a Unicode label. The stdlib codec implements IDNA2003,
+    which maps characters such as "ß" and "ς" where IDNA2008 registries keep
+    them, so labels it would alter are returned unchanged and miss the index
+    rather than matching a different domain.
+    """
+    if label.isascii():
+        return label
+    try:
+        encoded = label.encode('idna')
+        if encoded.decode('idna') != label:
+            return label
+        return encoded.decode('ascii')
+    except UnicodeError:
+        return label
+
+
+def domain_key(domain):
+    """
+    64-bit key used to store a registrable domain in the index.
+    """
+    digest = hashlib.blake2b(domain.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class DomainAgeIndex:
+    """
+    Read-only, memory-mapped index of domain registration dates.
+
+    The file holds a header, a sorted array of uint64 domain keys and a
+    parallel array of uint32 registration days since 1970-01-01. Lookups are a
+    binary search over the mapped keys, and the pages are shared through the
+    OS page cache by every worker process that opens the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            size = os.fstat(f.fileno()).st_size
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is not a domain age index")
+        magic, version, count = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a domain age index")
+        if size < HEADER.size + 12 * count:
+            raise ValueError(f"{path} is truncated")
+
+        self.count = count
+        self.keys = np.memmap(path, dtype='<u8', mode='r', offset=HEADER.size, shape=(count,))
+        self.days = np.memmap(path, dtype='<u4', mode='r',
+                              offset=HEADER.size + 8 * count, shape=(count,))
+
+    @classmethod
+    def from_env(cls):
+        """
+        Opens the index named by DOMAIN_AGE_INDEX, or returns None if it is
+        unset or unreadable.
+        """
+        path = os.environ.get('DOMAIN_AGE_INDEX')
+        if not path:
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            print(f"Error loading domain age index {path}: {e}")
+            return None
+
+    def __len__(self):
+        return self.count
+
+    def registration_date(self, host):
+        """
+        Returns the registration date of the host's registrable domain, or
+        None if it is not in the index.
+        """
+        domain = registrable_domain(host)
+        if not domain or self.count == 0:
+            return None
+        key = np.uint64(domain_key(domain))
+        i = int(np.searchsorted(self.keys, key))
+        if i < self.count and self.keys[i] == key:
+            return date.fromordinal(EPOCH.toordinal() + int(self.days[i]))
+        return None
+
+    def age_days(self, host, today=None):
+        registered = self.registration_date(host)
+        if registered is None:
+            return None
+        today = today or date.today()
+        return max((today - registered).days, 0)
+
+
+def _parse_date(field):
+    """
+    Returns days since epoch for a YYYY-MM-DD or YYYYMMDD value (optionally
+    followed by a time), or None if the field is not a valid date.
+    """
+    match = _DATE_PATTERN.search(field)
+    if not match:
+        return None
+    try:
+        registered = date(*(int(g) for g in match.groups()))
+    except ValueError:
+        return None
+    days = registered.toordinal() - EPOCH.toordinal()
+    return days if days >= 0 else None
+
+
+def _parse_row(fields):
+    """
+    Takes the domain from the first field and the first valid date from the
+    rest. Returns (domain, days since epoch) or None for headers and bad rows.
+    """
+    if len(fields) < 2:
+        return None
+    domain = registrable_domain(fields[0].strip().strip('"\''))
+    if not domain:
+        return None
+    for field in fields[1:]:
+        days = _parse_date(field)
+        if days is not None:
+            return domain, days
+    return None
+
+
+def _read_rows(f):
+    """
+    Yields field lists from a snapshot, parsing it as CSV if the first line
+    contains a comma and as whitespace-separated zone-style rows otherwise.
+    """
+    first = f.readline()
+    lines = chain([first], f)
+    if ',' in first:
+        yield from csv.reader(lines)
+    else:
+        for line in lines:
+            yield line.split()
+
+
+def build_index(source_path, output_path):
+    """
+    Builds an index file from a registration snapshot. Where a domain appears
+    more than once, the earliest date is kept.
+    """
+    keys = array('Q')
+    days = array('I')
+    skipped = 0
+
+    with open(source_path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        for fields in _read_rows(f):
+            parsed = _parse_row(fields)
+            if parsed is None:
+                skipped += 1
+                continue
+            keys.append(domain_key(parsed[0]))
+            days.append(parsed[1])
+
+    key_arr = np.frombuffer(keys, dtype=np.uint64)
+    day_arr = np.frombuffer(days, dtype=np.uint32)
+    # Sort by key, then date, so the first entry of each key is the earliest
+    order = np.lexsort((day_arr, key_arr))
+    key_arr = key_arr[order]
+    day_arr = day_arr[order]
+    first = np.ones(len(key_arr), dtype=bool)
+    first[1:] = key_arr[1:] != key_arr[:-1]
+    key_arr = key_arr[first]
+    day_arr = day_arr[first]
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(key_arr)))
+        f.write(key_arr.astype('<u8').tobytes())
+        f.write(day_arr.astype('<u4').tobytes())
+    # Replace atomically so running workers keep their existing mapping
+    os.replace(tmp_path, output_path)
+
+    return len(key_arr), skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build or query the offline domain registration index.'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build an index from a snapshot')
+    build.add_argument('source', help='CSV or zone-style dump of "domain date" rows')
+    build.add_argument('output', help='Path of the index file to write')
+
+    lookup = subparsers.add_parser('lookup', help='Look up domains in an index')
+    lookup.add_argument('index', help='Path of the index file')
+    lookup.add_argument('domains', nargs='+')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        start_time = time.time()
+        count, skipped = build_index(args.source, args.output)
+        print(f"Indexed {count} domains ({skipped} rows skipped) "
+              f"in {time.time() - start_time:.1f}s -> {args.output}")
+    else:
+        index = DomainAgeIndex(args.index)
+        for domain in args.domains:
+            registered = index.registration_date(domain)
+            print(f"{registrable_domain(domain)}\t{registered or 'unknown'}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+import cProfile
+import contextlib
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+class ScanProfiler:
+    """
+    Opt-in profiler for scan requests. Profiles are written to a bounded
+    on-disk ring as pstats plus collapsed stacks readable by flame graph tools.
+    When disabled and no profiling header is sent, the only cost per request
+    is a couple of attribute checks.
+
+    Runtime changes made through configure() are written to settings.json in
+    the profile directory, which every worker re-reads at most once a second.
+    Deleting the file restores the constructor (environment) settings.
+    """
+
+    HEADER = 'X-Profile-Scan'
+    ADMIN_HEADER = 'X-Admin-Token'
+    TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+    FORMATS = {'pstats': '.pstats', 'collapsed': '.collapsed', 'meta': '.json'}
+    SETTINGS_FILE = 'settings.json'
+    SETTINGS_REFRESH_S = 1.0
+    # Data files without metadata older than this are left over from failed saves
+    ORPHAN_GRACE_S = 600
+    _ID_PATTERN = re.compile(r'^[0-9]+-[0-9a-f]{8}$')
+
+    def __init__(self, profile_dir, max_profiles=50, sample_rate=0.0,
+                 sample_interval=0.005, admin_token=None):
+        self.profile_dir = os.path.abspath(profile_dir)
+        self.max_profiles = self._check_max_profiles(max_profiles)
+        self.sample_rate = self._check_sample_rate(sample_rate)
+        # Restored if settings.json is deleted
+        self._defaults = (self.sample_rate, self.max_profiles)
+        self.sample_interval = sample_interval
+        self.admin_token = admin_token
+        # Only one cProfile session may be active per interpreter
+        self._active = threading.Lock()
+        self._ring_lock = threading.Lock()
+        self._settings_path = os.path.join(self.profile_dir, self.SETTINGS_FILE)
+        self._settings_mtime = None
+        self._next_refresh = 0.0
+
+    @classmethod
+    def from_env(cls):
+        default_dir = os.path.join(os.path.dirname(__file__), '..', 'profiles')
+        return cls(
+            profile_dir=os.environ.get('SCAN_PROFILE_DIR', default_dir),
+            max_profiles=int(os.environ.get('SCAN_PROFILE_MAX', 50)),
+            sample_rate=float(os.environ.get('SCAN_PROFILE_SAMPLE_RATE', 0.0)),
+            admin_token=os.environ.get('SCAN_PROFILE_ADMIN_TOKEN') or None
+        )
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def is_authorized(self, headers):
+        """
+        Admin access requires SCAN_PROFILE_ADMIN_TOKEN to be set and sent in
+        the X-Admin-Token header; without a token, everything is denied.
+        """
+        if self.admin_token is None:
+            return False
+        token = headers.get(self.ADMIN_HEADER) or ''
+        try:
+            # Compare bytes: str comparison rejects non-ASCII input
+            return hmac.compare_digest(token.encode('utf-8'),
+                                       self.admin_token.encode('utf-8'))
+        except UnicodeError:
+            return False
+
+    def configure(self, sample_rate=None, max_profiles=None):
+        """
+        Updates the settings and persists them so that all workers sharing the
+        profile directory pick them up.
+        """
+        self._refresh_settings(force=True)
+        if sample_rate is not None:
+            sample_rate = self._check_sample_rate(sample_rate)
+        if max_profiles is not None:
+            max_profiles = self._check_max_profiles(max_profiles)
+
+        stored = {
+            'sample_rate': self.sample_rate if sample_rate is None else sample_rate,
+            'max_profiles': self.max_profiles if max_profiles is None else max_profiles
+        }
+        os.makedirs(self.profile_dir, exist_ok=True)
+        tmp_path = f"{self._settings_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(stored, f)
+        os.replace(tmp_path, self._settings_path)
+
+        self.sample_rate = stored['sample_rate']
+        self.max_profiles = stored['max_profiles']
+        self._settings_mtime = os.stat(self._settings_path).st_mtime_ns
+        with self._ring_lock:
+            self._prune()
+        return self.settings()
+
+    def _refresh_settings(self, force=False):
+        now = time.monotonic()
+        if not force and now < self._next_refresh:
+            return
+        self._next_refresh = now + self.SETTINGS_REFRESH_S
+        try:
+            mtime = os.stat(self._settings_path).st_mtime_ns
+        except FileNotFoundError:
+            if self._settings_mtime is not None:
+                self.sample_rate, self.max_profiles = self._defaults
+                self._settings_mtime = None
+            return
+        if mtime == self._settings_mtime:
+            return
+        self._settings_mtime = mtime
+        try:
+            with open(self._settings_path) as f:
+                stored = json.load(f)
+            self.sample_rate = self._check_sample_rate(stored['sample_rate'])
+            self.max_profiles = self._check_max_profiles(stored['max_profiles'])
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            print(f"Error loading profiler settings: {e}")
+
+    @staticmethod
+    def _check_sample_rate(sample_rate):
+        # bool is an int subclass, so JSON true would otherwise mean 1.0
+        if isinstance(sample_rate, bool):
+            raise ValueError('sample_rate must be a number')
+        sample_rate = float(sample_rate)
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError('sample_rate must be between 0 and 1')
+        return sample_rate
+
+    @staticmethod
+    def _check_max_profiles(max_profiles):
+        if isinstance(max_profiles, bool) or \
+                (isinstance(max_profiles, float) and not max_profiles.is_integer()):
+            raise ValueError('max_profiles must be an integer')
+        max_profiles = int(max_profiles)
+        if max_profiles < 1:
+            raise ValueError('max_profiles must be at least 1')
+        return max_profiles
+
+    def settings(self):
+        self._refresh_settings(force=True)
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'max_profiles': self.max_profiles
+        }
+
+    def maybe_profile(self, headers, label):
+        """
+        Returns a context manager that profiles the enclosed block if this
+        request was selected, otherwise a no-op context.
+        """
+        self._refresh_settings()
+        requested = headers.get(self.HEADER)
+        if requested and requested.strip().lower() in self.TRUE_VALUES \
+                and self.is_authorized(headers):
+            return self._profile(label, 'header')
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return self._profile(label, 'sampled')
+        return contextlib.nullcontext()
+
+    @contextlib.contextmanager
+    def _profile(self, label, trigger):
+        # Skip rather than queue behind a concurrent profile
+        if not self._active.acquire(blocking=False):
+            yield
+            return
+
+        try:
+            sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+            profile = cProfile.Profile()
+            started_at = time.time()
+            sampler.start()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                sampler.stop()
+                duration = time.time() - started_at
+                self._save(profile, sampler.stacks, {
+                    'label': label,
+                    'trigger': trigger,
+                    'started_at': started_at,
+                    'duration_s': round(duration, 4),
+                    'samples': sum(sampler.stacks.values())
+                })
+        finally:
+            self._active.release()
+
+    def _save(self, profile, stacks, meta):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profile_id = f"{int(meta['started_at'] * 1000)}-{uuid.uuid4().hex[:8]}"
+            meta['id'] = profile_id
+            base = os.path.join(self.profile_dir, profile_id)
+        except OSError as e:
+            print(f"Error saving scan profile: {e}")
+            return
+
+        try:
+            profile.dump_stats(base + '.pstats')
+            with open(base + '.collapsed', 'w') as f:
+                for stack, count in stacks.items():
+                    f.write(f"{stack} {count}\n")
+            # Metadata is written last so listing never sees a partial profile
+            with open(base + '.json', 'w') as f:
+                json.dump(meta, f)
+        except OSError as e:
+            print(f"Error saving scan profile: {e}")
+            for ext in self.FORMATS.values():
+                with contextlib.suppress(OSError):
+                    os.remove(base + ext)
+            return
+
+        with self._ring_lock:
+            self._prune()
+
+    def _prune(self):
+        names = self._listdir()
+        profile_ids = self._profile_ids(names)
+        for profile_id in profile_ids[:-self.max_profiles]:
+            self._remove(profile_id)
+
+        # Sweep data files whose metadata was never written, e.g. after a crash
+        # mid-save in another worker. Recent ones may still be in progress.
+        saved = set(profile_ids)
+        cutoff_ms = (time.time() - self.ORPHAN_GRACE_S) * 1000
+        for name in names:
+            profile_id = name.split('.', 1)[0]
+            if profile_id not in saved and self._ID_PATTERN.match(profile_id) \
+                    and int(profile_id.split('-')[0]) < cutoff_ms:
+                self._remove(profile_id)
+                saved.add(profile_id)
+
+    def _remove(self, profile_id):
+        for ext in self.FORMATS.values():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.profile_dir, profile_id + ext))
+
+    def _listdir(self):
+        try:
+            return os.listdir(self.profile_dir)
+        except FileNotFoundError:
+            return []
+
+    def _profile_ids(self, names=None):
+        if names is None:
+            names = self._listdir()
+        profile_ids = [
+            name[:-5] for name in names
+            if name.endswith('.json') and self._ID_PATTERN.match(name[:-5])
+        ]
+        # Ids start with a millisecond timestamp, so oldest sort first
+        return sorted(profile_ids, key=lambda p: int(p.split('-')[0]))
+
+    def list_profiles(self):
+        profiles = []
+        for profile_id in reversed(self._profile_ids()):
+            with contextlib.suppress(OSError, ValueError):
+                with open(os.path.join(self.profile_dir, profile_id + '.json')) as f:
+                    profiles.append(json.load(f))
+        return profiles
+
+    def profile_path(self, profile_id, fmt):
+        """
+        Returns the file path for a stored profile, or None if the id or format
+        is unknown.
+        """
+        ext = self.FORMATS.get(fmt)
+        if ext is None or not self._ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.profile_dir, profile_id + ext)
+        return path if os.path.exists(path) else None
+
+
+class _StackSampler:
+    """
+    Samples the call stack of one thread at a fixed interval and aggregates
+    the samples in collapsed-stack form.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                names.append(f"{code.co_name} ({filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            # Semicolons separate frames in collapsed format
+            self.stacks[';'.join(reversed(names))] += 1
@@ -1,3 +1,6 @@
+import ipaddress
+import math
+import os
 import requests
 from bs4 import BeautifulSoup
 import re
@@ -6,9 +9,25 @@ import socket
 from collections import Counter
 import time
 from textblob import TextBlob
+from backend.utils.domain_index import DomainAgeIndex
+
+# Domains registered at least this long ago get the maximum domain_age feature
+MATURE_DOMAIN_DAYS = 365
+
+def _unknown_domain_age():
+    value = float(os.environ.get('DOMAIN_AGE_UNKNOWN', 0.5))
+    if not math.isfinite(value) or not 0.0 <= value <= 1.0:
+        raise ValueError('DOMAIN_AGE_UNKNOWN must be between 0 and 1')
+    return value
+
+# domain_age used when an index is loaded but the domain is not in it. Misses
+# are often registrations newer than the snapshot, so they must not score as
+# established; 0.5 neither flags them as new nor earns the safe-URL discount.
+UNKNOWN_DOMAIN_AGE = _unknown_domain_age()
 
 class URLAnalyzer:
-    def __init__(self):
+    def __init__(self, domain_index=None):
+        self.domain_index = domain_index if domain_index is not None else DomainAgeIndex.from_env()
         self.suspicious_keywords = [
             'login', 'verify', 'account', 'update', 'secure', 'banking',
             'paypal', 'amazon', 'signin', 'confirm', 'suspended'
@@ -172,15 +191,32 @@ class URLAnalyzer:
         return domain.count('.') - 1 if domain.count('.') > 1 else 0
     
     def _estimate_domain_age(self, url):
-        # Simplified - in production, use WHOIS lookup
+        """
+        Returns the domain age scaled to [0, 1], where 1 means registered at
+        least MATURE_DOMAIN_DAYS ago. Domains missing from the index get
+        UNKNOWN_DOMAIN_AGE; without an index, any host is estimated as 1.
+        """
         try:
             parsed = urlparse(url)
-            domain = parsed.netloc
-            # Return estimated age (0 = new, 1 = old)
-            return 1 if len(domain) > 0 else 0
+            domain = parsed.hostname or ''
+            if not domain:
+                return 0
+            if self.domain_index is not None and not self._is_ip_literal(domain):
+                age_days = self.domain_index.age_days(domain)
+                if age_days is None:
+                    return UNKNOWN_DOMAIN_AGE
+                return min(age_days / MATURE_DOMAIN_DAYS, 1.0)
+            return 1
         except:
             return 0
     
+    def _is_ip_literal(self, host):
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+    
     def _count_special_chars(self, url):
         special_chars = ['@', '?', '-', '=', '.', '#', '%', '+', '$', '!', '*', ',', '//']
         return sum(url.count(char) for char in special_chars)